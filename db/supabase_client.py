@@ -1,25 +1,34 @@
 from supabase import create_client, Client
+import logging
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SUPABASE_URL = os.getenv("SUPABASE_URL", "YOUR_SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "YOUR_SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_client = None
 
-def insert_job_result(job_id: int, video: dict, analysis: dict):
+
+def get_client() -> Client:
     """
-    Inserts a job result into the job_results table in Supabase.
-    Maps summary to next_hot_topic from analysis.
-    Args:
-        job_id: BIGINT job ID (not UUID)
-        video: Video data dictionary
-        analysis: Analysis results dictionary
-    Returns:
-        APIResponse: The response object from supabase-py. Check .data for inserted rows.
+    Returns the shared Supabase client, creating it on first use.
+    Lazy construction keeps imports cheap (tests, tooling, --reload worker
+    respawns) and means the module can be imported without credentials.
     """
-    data = {
+    global _client
+    if _client is None:
+        _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _client
+
+def _build_row(job_id: int, video: dict, analysis: dict) -> dict:
+    """Maps a (video, analysis) pair to a job_results row. Maps summary to
+    next_hot_topic from analysis."""
+    if not analysis.get('pros') and not analysis.get('cons') and not analysis.get('next_hot_topic'):
+        logger.warning("Database: All analysis fields are empty for video %s", video['video_id'])
+    return {
         "job_id": job_id,  # Now BIGINT instead of UUID
         "video_id": video["video_id"],
         "channel_title": video.get("channelTitle"),
@@ -29,22 +38,35 @@ def insert_job_result(job_id: int, video: dict, analysis: dict):
         "cons": analysis.get("cons"),
         "summary": analysis.get("next_hot_topic"),
     }
-    
-    # Log the data being inserted for debugging
-    import logging
-    logger = logging.getLogger(__name__)
-    # logger.info(f"Database: Inserting job result: job_id={job_id}, video_id={video['video_id']}")
-    # logger.info(f"Database: Analysis data: pros='{analysis.get('pros', '')[:100]}...', cons='{analysis.get('cons', '')[:100]}...', next_hot_topic='{analysis.get('next_hot_topic', '')[:100]}...'")
-    
-    # Check if all analysis fields are empty
-    if not analysis.get('pros') and not analysis.get('cons') and not analysis.get('next_hot_topic'):
-        logger.warning(f"Database: All analysis fields are empty for video {video['video_id']}")
-    
+
+
+def insert_job_results(job_id: int, rows: list):
+    """
+    Inserts many job results into the job_results table in one request.
+    One bulk insert amortizes the TLS handshake and Postgres round trip
+    over all rows instead of paying them per video.
+    Args:
+        job_id: BIGINT job ID (not UUID)
+        rows: list of (video, analysis) tuples
+    Returns:
+        APIResponse: The response object from supabase-py, or None when
+        rows is empty. Check .data for inserted rows.
+    """
+    if not rows:
+        return None
+    data_list = [_build_row(job_id, video, analysis) for video, analysis in rows]
     try:
         # The returned object has a .data attribute with the inserted rows
-        response = supabase.table("job_results").insert(data).execute()
-        # logger.info(f"Database: Successfully inserted job result for video {video['video_id']}")
+        response = get_client().table("job_results").insert(data_list).execute()
         return response
     except Exception as e:
-        logger.error(f"Database: Failed to insert job result for video {video['video_id']}: {e}")
-        raise 
\ No newline at end of file
+        logger.error("Database: Failed to insert %d job results for job %s: %s", len(data_list), job_id, e)
+        raise
+
+
+def insert_job_result(job_id: int, video: dict, analysis: dict):
+    """
+    Inserts a single job result. Thin wrapper over insert_job_results kept
+    for callers that produce one row at a time.
+    """
+    return insert_job_results(job_id, [(video, analysis)])
\ No newline at end of file
@@ -1,10 +1,38 @@
 import os
 from dotenv import load_dotenv
 import requests
+import httpx
+import orjson
 import json
 import logging
 import re
-from langdetect import detect
+import functools
+import hashlib
+import diskcache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from langdetect import detect, DetectorFactory
+
+# langdetect is randomly seeded by default and can flip on borderline
+# inputs; pinning the seed makes results stable (and cacheable).
+DetectorFactory.seed = 0
+
+# Warm the detector at import: langdetect lazily loads ~50 language
+# profiles on first use, which would otherwise land as a latency spike on
+# the first non-ASCII comment of each worker process.
+try:
+    detect("hello world")
+except Exception:
+    pass
+
+# gcld3 (Google's compact C++ language classifier) is orders of magnitude
+# faster than the pure-Python langdetect port. Use it when installed and
+# fall back to langdetect otherwise.
+try:
+    import gcld3
+    _CLD3 = gcld3.NNetLanguageIdentifier(min_num_bytes=0, max_num_bytes=1000)
+except ImportError:
+    _CLD3 = None
 
 load_dotenv()
 
@@ -14,9 +42,118 @@ logger = logging.getLogger(__name__)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 LLM_MODEL = os.getenv("LLM_MODEL", "mistralai/mistral-7b-instruct:free")
 
-EMOJI_PATTERN = re.compile('[\ 0-\uFFFF]', flags=re.UNICODE)
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# One shared session so repeated OpenRouter calls reuse pooled TCP+TLS
+# connections instead of paying a fresh handshake per video. The headers
+# never change between calls, so build them once too. Transient gateway
+# errors are retried at the adapter level; 429/403 are deliberately left
+# out of the retry list because the model-fallback loop already moves to
+# the next model on those.
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=requests.adapters.Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=None,  # retry POSTs too; chat completions are idempotent enough
+    ),
+))
+
+_HEADERS = {
+    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+    "HTTP-Referer": "https://openrouter.ai/",
+    "X-Title": "YouTube Comment Analyzer"
+}
+
+# Precompiled once at import \u2014 simple_text runs per comment and re.sub with a
+# literal pattern paid a regex-cache lookup (and worst case a rebuild) per call.
+_WS_RE = re.compile(r'\s+')
+
+# Emoji stripping: a str.translate table beats walking the regex NFA for the
+# BMP symbol blocks, and pure-ASCII comments (the common case) skip both.
+# The astral plane stays a regex \u2014 a translate table covering 0x10000-0x10FFFF
+# would hold ~a million entries.
+_EMOJI_TABLE = dict.fromkeys(range(0x2600, 0x27C0))
+_ASTRAL_RE = re.compile(r'[\U00010000-\U0010ffff]+')
+
+# The third-party regex module supports Unicode property classes, whose
+# C-side table lookup covers the whole pictographic set in one sub. Used
+# when installed, like gcld3 above; the table+astral path is the fallback.
+try:
+    import regex as _regex
+    _PICTO_RE = _regex.compile(r'\p{Extended_Pictographic}+')
+except ImportError:
+    _PICTO_RE = None
+
+# Reused decoder for pulling a JSON object out of mixed LLM prose via
+# raw_decode; stdlib here because orjson has no offset-based entry point.
+_JSON_DECODER = json.JSONDecoder()
+
+# Regex fallback in extract_sections_from_text: one pass locating all
+# section headers, with the spans between consecutive headers sliced out —
+# instead of three overlapping DOTALL searches over the whole response.
+_BULLET_RE = re.compile(r'(?:^|\n)[•\-\*]\s*([^\n]+)', re.MULTILINE)
+# Headers must sit at the start of a line (allowing markdown #/*) and end
+# with a colon — an unanchored match on bare POSITIVE/NEGATIVE would fire
+# on those words inside bullet bodies ("the positive tone…") and cut the
+# enclosing section short.
+_HEADER_RE = re.compile(
+    r'^[ \t#*]*(PROS|POSITIVES?|CONS|NEGATIVES?|NEXT\s+HOT\s+TOPIC|SUGGESTED\s+TOPICS?)\s*:',
+    re.IGNORECASE | re.MULTILINE)
+_HEADER_KEY = {
+    "PROS": "pros",
+    "POSITIVE": "pros",
+    "POSITIVES": "pros",
+    "CONS": "cons",
+    "NEGATIVE": "cons",
+    "NEGATIVES": "cons",
+    "NEXT HOT TOPIC": "next_hot_topic",
+    "SUGGESTED TOPIC": "next_hot_topic",
+    "SUGGESTED TOPICS": "next_hot_topic",
+}
+
+
+def _split_sections(text):
+    """Maps section name -> raw section body in a single header scan.
+
+    The body of each section runs from the end of its header to the start
+    of the next one; the first occurrence of each section wins."""
+    sections = {}
+    matches = _HEADER_RE.finditer(text)
+    prev_key = prev_end = None
+    for m in matches:
+        if prev_key is not None and prev_key not in sections:
+            sections[prev_key] = text[prev_end:m.start()]
+        prev_key = _HEADER_KEY[' '.join(m.group(1).upper().split())]
+        prev_end = m.end()
+    if prev_key is not None and prev_key not in sections:
+        sections[prev_key] = text[prev_end:]
+    return sections
+
+# By default non-ASCII comments are judged by byte ratio instead of the
+# n-gram detector — one pass over the encoded bytes versus a ~ms-scale
+# classification. Set STRICT_LANGUAGE_FILTER=1 to run the real detector
+# on every non-ASCII comment (mixed-language channels).
+_STRICT_LANGUAGE_FILTER = os.environ.get("STRICT_LANGUAGE_FILTER", "0") == "1"
+
 
+@functools.lru_cache(maxsize=4096)
 def is_english(text):
+    # ASCII-only text containing at least one letter is overwhelmingly
+    # English on YouTube; skip the n-gram detector entirely for it. The
+    # cache absorbs near-duplicate comments that survive raw-string dedup.
+    if text.isascii() and any(c.isalpha() for c in text):
+        return True
+    if not _STRICT_LANGUAGE_FILTER:
+        # Mostly-ASCII bytes means English text with some accents or
+        # symbols sprinkled in; heavily non-ASCII text is another script.
+        encoded = text.encode('utf-8', 'ignore')
+        return bool(encoded) and sum(b < 128 for b in encoded) / len(encoded) > 0.85
+    if _CLD3 is not None:
+        return _CLD3.FindLanguage(text=text).language == 'en'
     try:
         return detect(text) == 'en'
     except Exception:
@@ -24,19 +161,46 @@ def is_english(text):
 
 def remove_emoji(text):
     # Remove all emoji and non-text symbols
-    return re.sub(r'[\U00010000-\U0010ffff\u2600-\u26FF\u2700-\u27BF]+', '', text)
+    if text.isascii():
+        return text
+    if _PICTO_RE is not None:
+        return _PICTO_RE.sub('', text)
+    return _ASTRAL_RE.sub('', text.translate(_EMOJI_TABLE))
 
 def simple_text(text):
     # Remove emoji, strip, and collapse whitespace
-    text = remove_emoji(text)
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+    return _WS_RE.sub(' ', remove_emoji(text)).strip()
+
+def _clean(items):
+    # Strip each entry exactly once and drop empties in the same pass.
+    return [s for s in (x.strip() for x in items) if s]
 
 def ensure_str(val):
     if isinstance(val, list):
         return "\n".join(str(v) for v in val)
     return str(val) if val is not None else ""
 
+# Finished analyses keyed by (video_id, digest of sanitized comments),
+# persisted on disk so UI retries and repeat searches skip the LLM entirely
+# — even across process restarts. The comment digest keeps entries honest:
+# new comments on a video produce a new key.
+_LLM_CACHE = diskcache.Cache(os.environ.get("LLM_CACHE_DIR", "/tmp/llm_cache"), size_limit=2**30)
+_LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+
+
+def _llm_cache_key(video_id, sanitized_comments):
+    h = hashlib.blake2b(video_id.encode(), digest_size=16)
+    for c in sorted(sanitized_comments):
+        h.update(b"|")
+        h.update(c.encode())
+    return h.hexdigest()
+
+
+# How many models the sync path races per wave. Serial fallback cost up to
+# sum-of-timeouts on rate-limit days; racing turns that into min-of-latencies
+# at the price of a few redundant generations when several models answer.
+_RACE_WIDTH = max(1, int(os.environ.get("LLM_RACE_WIDTH", 3)))
+
 openrouter_models = [
     "mistralai/mistral-7b-instruct",
     "openchat/openchat-3.5-0106",
@@ -48,22 +212,30 @@ openrouter_models = [
     "openrouter/cinematika-7b-v2"
 ]
 
-def analyze_video_comments(video, comments):
-    comments_fetched = len(comments)
-    # Sanitize comments
+def _sanitize_comments(comments):
+    raw_seen = set()
     seen = set()
     sanitized_comments = []
     for c in comments:
+        # Byte-identical repeats (common on YouTube threads) are dropped on
+        # the raw string so they never pay the regex cleanup below.
+        if c in raw_seen:
+            continue
+        raw_seen.add(c)
         c_clean = simple_text(c)
-        if c_clean and c_clean not in seen and is_english(c_clean):
-            if len(c_clean.split()) <= 100:
-                sanitized_comments.append(c_clean)
-                seen.add(c_clean)
-    comments_sanitized = len(sanitized_comments)
-    
-    # logger.info(f"Video {video['video_id']}: {comments_fetched} comments fetched, {comments_sanitized} sanitized")
-    
-    base_response = {
+        if not c_clean or c_clean in seen:
+            continue
+        # Mark duplicates before the language check so repeated copies of a
+        # rejected comment never re-run the detector; the cheap word-count
+        # filter also runs first for the same reason.
+        seen.add(c_clean)
+        if len(c_clean.split()) <= 100 and is_english(c_clean):
+            sanitized_comments.append(c_clean)
+    return sanitized_comments
+
+
+def _base_response(video, comments_fetched, comments_sanitized):
+    return {
         "video_id": video["video_id"],
         "video_title": video["video_title"],
         "channelTitle": video["channelTitle"],
@@ -76,110 +248,402 @@ def analyze_video_comments(video, comments):
         "comments_sanitized": comments_sanitized
     }
 
+
+# Per-model health as an exponential moving average of recent outcomes.
+# Models that keep rate-limiting or failing sink in the ordering, so over a
+# batch of videos calls converge on whichever model is actually answering
+# instead of re-walking the same dead entries every time.
+_SCORES = {m: 1.0 for m in openrouter_models}
+_SCORES_LOCK = Lock()
+
+
+def _record_model_result(model, ok):
+    with _SCORES_LOCK:
+        _SCORES[model] = 0.9 * _SCORES[model] + (0.1 if ok else 0.0)
+
+
+def _models_by_health():
+    with _SCORES_LOCK:
+        return sorted(openrouter_models, key=_SCORES.__getitem__, reverse=True)
+
+
+def _chat_payload(model, prompt):
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant that analyzes YouTube comments."},
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+
+def _interpret_llm_content(content, video, model):
+    """Turns assembled completion text into (result, error).
+
+    result is the extracted sections dict on success, otherwise None with
+    error set — callers treat None as "try the next model"."""
+    if not content or content.strip() == "":
+        logger.error("LLM API: Empty response from model %s for video %s, trying next model...", model, video['video_id'])
+        return None, "Empty response from LLM API"
+    result = extract_sections_from_text(content)
+    # Check if all sections are empty
+    if not result.get('pros') and not result.get('cons') and not result.get('next_hot_topic'):
+        logger.error("LLM API: All extracted sections are empty for video %s (model %s), trying next model...", video['video_id'], model)
+        return None, "All extracted sections are empty"
+    return result, None
+
+
+def _interpret_llm_response(status_code, body, text, video, model):
+    """Turns one non-streamed OpenRouter response into (result, error).
+
+    Shared by the batch and async analyze paths so the fallback semantics
+    stay identical to the streaming sync path."""
+    if status_code == 200:
+        return _interpret_llm_content(orjson.loads(body)["choices"][0]["message"]["content"], video, model)
+    if status_code == 408:
+        return None, "Timeout"
+    if status_code in (429, 403):
+        return None, text
+    logger.error("LLM API error (model %s): %s", model, text)
+    return None, text
+
+
+# Content followed by a blank line — the model moved past the section.
+_SECTION_DONE_RE = re.compile(r'\S[ \t]*\n[ \t]*\n')
+
+
+def _sections_complete(text):
+    """True once all three sections have content and the final section
+    actually looks finished: a blank line after its content, or at least
+    two bullet lines already terminated by newlines (the prompt asks for
+    2-3 topics). Bare truthiness isn't enough — the rescan cadence would
+    close the stream a few tokens into NEXT HOT TOPIC and truncate it
+    mid-bullet."""
+    sections = _split_sections(text)
+    if not all(sections.get(key, "").strip() for key in ("pros", "cons", "next_hot_topic")):
+        return False
+    tail = sections["next_hot_topic"]
+    if _SECTION_DONE_RE.search(tail):
+        return True
+    # Drop the still-streaming last line; only count complete bullets.
+    finished = tail[:tail.rfind('\n') + 1]
+    return len(_BULLET_RE.findall(finished)) >= 2
+
+
+def _post_model_streaming(model, prompt):
+    """Calls one model with stream=True, assembling content deltas as they
+    arrive. Once all three sections have appeared the connection is closed,
+    cutting off trailing tokens instead of waiting for end-of-sequence.
+    Returns (status_code, text) where text is the assembled content on 200
+    and the error body otherwise."""
+    payload = _chat_payload(model, prompt)
+    payload["stream"] = True
+    response = _SESSION.post(OPENROUTER_URL, headers=_HEADERS, json=payload, timeout=180, stream=True)
+    if response.status_code != 200:
+        text = response.text
+        response.close()
+        return response.status_code, text
+    parts = []
+    pending = 0
+    try:
+        for line in response.iter_lines():
+            if not line or not line.startswith(b"data: "):
+                continue
+            data = line[6:]
+            if data == b"[DONE]":
+                break
+            try:
+                delta = orjson.loads(data)["choices"][0].get("delta", {}).get("content")
+            except (orjson.JSONDecodeError, KeyError, IndexError):
+                continue
+            if not delta:
+                continue
+            parts.append(delta)
+            # Rescan every few deltas rather than per token — three regex
+            # searches per SSE chunk would cost more than they save.
+            pending += 1
+            if pending >= 8:
+                pending = 0
+                if _sections_complete("".join(parts)):
+                    break
+    finally:
+        response.close()
+    return 200, "".join(parts)
+
+
+def analyze_video_comments(video, comments):
+    comments_fetched = len(comments)
+    sanitized_comments = _sanitize_comments(comments)
+    base_response = _base_response(video, comments_fetched, len(sanitized_comments))
+
     if not sanitized_comments:
         base_response["reason"] = "No valid comments found after filtering." if comments_fetched > 0 else "No comments fetched from API."
-        logger.warning(f"Video {video['video_id']}: {base_response['reason']}")
+        logger.warning("Video %s: %s", video['video_id'], base_response['reason'])
         return base_response
 
+    cache_key = _llm_cache_key(video["video_id"], sanitized_comments)
+    cached = _LLM_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     prompt = build_prompt(video, sanitized_comments)
     #logger.info(f"LLM Prompt for video {video['video_id']}:\n{prompt}")
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "HTTP-Referer": "https://openrouter.ai/",
-        "X-Title": "YouTube Comment Analyzer"
-    }
-    
+
+    last_error = None
+    # Models are raced _RACE_WIDTH at a time in health order: the first
+    # success in a wave wins and the next wave only starts if the whole
+    # wave failed.
+    models = _models_by_health()
+    for start in range(0, len(models), _RACE_WIDTH):
+        wave = models[start:start + _RACE_WIDTH]
+        pool = ThreadPoolExecutor(max_workers=len(wave))
+        futures = [pool.submit(_call_model, model, prompt, video) for model in wave]
+        winner = None
+        for future in as_completed(futures):
+            result, error = future.result()
+            if result is not None:
+                winner = result
+                break
+            last_error = error
+        # Don't block on losing in-flight requests; their streamed
+        # connections close as soon as their sections complete anyway.
+        pool.shutdown(wait=False, cancel_futures=True)
+        if winner is not None:
+            base_response.update(winner)
+            _LLM_CACHE.set(cache_key, base_response, expire=_LLM_CACHE_TTL)
+            return base_response
+
+    logger.error("LLM API: All models failed for video %s. Last error: %s", video['video_id'], last_error)
+    base_response["reason"] = "LLM analysis failed for all models."
+    return base_response
+
+
+def _call_model(model, prompt, video):
+    """One model attempt on the sync/streaming path. Returns (result, error)
+    with result None when the caller should try another model."""
+    try:
+        status_code, text = _post_model_streaming(model, prompt)
+        if status_code == 200:
+            result, error = _interpret_llm_content(text, video, model)
+        else:
+            result, error = _interpret_llm_response(status_code, b"", text, video, model)
+        _record_model_result(model, result is not None)
+        return result, error
+    except Exception as e:
+        logger.error("LLM API: Exception calling model %s for video %s: %s", model, video['video_id'], e)
+        _record_model_result(model, False)
+        return None, str(e)
+
+
+async def analyze_video_comments_async(client: httpx.AsyncClient, video, comments):
+    """Async variant of analyze_video_comments for callers that fan a job's
+    videos out on an event loop. Sanitization, prompting and model-fallback
+    semantics are shared with the sync path; only the HTTP call differs."""
+    comments_fetched = len(comments)
+    sanitized_comments = _sanitize_comments(comments)
+    base_response = _base_response(video, comments_fetched, len(sanitized_comments))
+
+    if not sanitized_comments:
+        base_response["reason"] = "No valid comments found after filtering." if comments_fetched > 0 else "No comments fetched from API."
+        logger.warning("Video %s: %s", video['video_id'], base_response['reason'])
+        return base_response
+
+    cache_key = _llm_cache_key(video["video_id"], sanitized_comments)
+    cached = _LLM_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = build_prompt(video, sanitized_comments)
+
     last_error = None
-    for model in openrouter_models:
-        payload = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": "You are a helpful assistant that analyzes YouTube comments."},
-                {"role": "user", "content": prompt}
-            ]
-        }
+    for model in _models_by_health():
         try:
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
+            response = await client.post(
+                OPENROUTER_URL,
+                headers=_HEADERS,
+                json=_chat_payload(model, prompt),
                 timeout=180
             )
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"]
-                # logger.info(f"Raw LLM response for video {video['video_id']} (model {model}):\n{content}")
-                
-                if not content or content.strip() == "":
-                    logger.error(f"LLM API: Empty response from model {model} for video {video['video_id']}, trying next model...")
-                    last_error = "Empty response from LLM API"
-                    continue
-                
-                result = extract_sections_from_text(content)
-                # logger.info(f"Extracted sections for video {video['video_id']}: pros='{result.get('pros', '')[:100]}...', cons='{result.get('cons', '')[:100]}...', next_hot_topic='{result.get('next_hot_topic', '')[:100]}...'")
-                
-                # Check if all sections are empty
-                if not result.get('pros') and not result.get('cons') and not result.get('next_hot_topic'):
-                    logger.error(f"LLM API: All extracted sections are empty for video {video['video_id']} (model {model}), trying next model...")
-                    last_error = "All extracted sections are empty"
-                    continue
-                
+            result, error = _interpret_llm_response(response.status_code, response.content, response.text, video, model)
+            _record_model_result(model, result is not None)
+            if result is not None:
                 base_response.update(result)
+                _LLM_CACHE.set(cache_key, base_response, expire=_LLM_CACHE_TTL)
                 return base_response
-            elif response.status_code == 408:
-                # logger.warning(f"LLM API: Model {model} timed out (status 408), trying next model...")
-                last_error = "Timeout"
-                continue
-            elif response.status_code in [429, 403]:
-                # logger.warning(f"LLM API: Model {model} rate limited (status {response.status_code}), trying next model...")
-                last_error = response.text
-                continue
-            else:
-                logger.error(f"LLM API error (model {model}): {response.text}")
-                last_error = response.text
-                continue  # Try next model instead of breaking
+            last_error = error
         except Exception as e:
-            logger.error(f"LLM API: Exception calling model {model} for video {video['video_id']}: {e}")
+            logger.error("LLM API: Exception calling model %s for video %s: %s", model, video['video_id'], e)
+            _record_model_result(model, False)
             last_error = str(e)
-            continue
-    
-    logger.error(f"LLM API: All models failed for video {video['video_id']}. Last error: {last_error}")
+
+    logger.error("LLM API: All models failed for video %s. Last error: %s", video['video_id'], last_error)
     base_response["reason"] = "LLM analysis failed for all models."
     return base_response
 
+def analyze_videos_batch(videos_with_comments, batch_size=4):
+    """Analyzes several videos per LLM round trip.
+
+    videos_with_comments is a list of (video, comments) pairs; batch_size
+    videos are packed into one prompt asking for a JSON array of per-video
+    sections, then demultiplexed by video_id. Videos the model skips fall
+    back to the per-video path, so results are never silently lost.
+    Returns (video, analysis) pairs in input order.
+    """
+    results = []
+    for start in range(0, len(videos_with_comments), batch_size):
+        results.extend(_analyze_batch_chunk(videos_with_comments[start:start + batch_size]))
+    return results
+
+
+def _analyze_batch_chunk(chunk):
+    prepared = []  # (video, comments, base_response, sanitized)
+    entries = []
+    for video, comments in chunk:
+        sanitized = _sanitize_comments(comments)
+        base = _base_response(video, len(comments), len(sanitized))
+        if not sanitized:
+            base["reason"] = "No valid comments found after filtering." if comments else "No comments fetched from API."
+            logger.warning("Video %s: %s", video['video_id'], base['reason'])
+        else:
+            entries.append((video, sanitized))
+        prepared.append((video, comments, base, sanitized))
+
+    answered = {}
+    if entries:
+        prompt = build_batch_prompt(entries)
+        for model in _models_by_health():
+            try:
+                response = _SESSION.post(
+                    OPENROUTER_URL,
+                    headers=_HEADERS,
+                    json=_chat_payload(model, prompt),
+                    timeout=180
+                )
+                if response.status_code != 200:
+                    logger.error("LLM API: Batch call failed on model %s (status %s), trying next model...", model, response.status_code)
+                    continue
+                content = orjson.loads(response.content)["choices"][0]["message"]["content"]
+                start = content.find('{')
+                if start == -1:
+                    continue
+                data, _ = _JSON_DECODER.raw_decode(content, start)
+                for item in data.get("results", []):
+                    vid = item.get("video_id")
+                    if not vid:
+                        continue
+                    answered[vid] = {
+                        "pros": ensure_str(item.get("pros", "")),
+                        "cons": ensure_str(item.get("cons", "")),
+                        "next_hot_topic": ensure_str(item.get("next_hot_topic", "")),
+                    }
+                if answered:
+                    break
+            except Exception as e:
+                logger.error("LLM API: Batch exception on model %s: %s", model, e)
+                continue
+
+    results = []
+    for video, comments, base, sanitized in prepared:
+        sections = answered.get(video["video_id"])
+        if sections and (sections["pros"] or sections["cons"] or sections["next_hot_topic"]):
+            base.update(sections)
+            results.append((video, base))
+        elif sanitized:
+            # Model dropped or garbled this video — analyze it on its own.
+            results.append((video, analyze_video_comments(video, comments)))
+        else:
+            results.append((video, base))
+    return results
+
+
+def build_batch_prompt(entries):
+    # Each video gets an equal share of the prompt budget.
+    per_video_budget = _PROMPT_TOKEN_BUDGET // len(entries)
+    blocks = []
+    for i, (video, comments) in enumerate(entries, 1):
+        comments_str = "\n- ".join(_pack_comments(comments, per_video_budget))
+        blocks.append(
+            f"### Video {i} (video_id={video['video_id']})\n"
+            f"Title: {video['video_title']}\n"
+            f"Channel: {video['channelTitle']}\n"
+            f"Comments:\n- {comments_str}"
+        )
+    videos_str = "\n\n".join(blocks)
+    return f"""You are a YouTube comment analyzer. Analyze the comments of each video below and provide insights.
+
+{videos_str}
+
+Respond with ONLY a JSON object in this EXACT shape, one entry per video, keyed by the video_id given above:
+
+{{"results": [{{"video_id": "...", "pros": ["..."], "cons": ["..."], "next_hot_topic": ["..."]}}]}}
+
+For each video: pros lists positive aspects mentioned by viewers, cons lists criticisms (never topic suggestions), next_hot_topic lists 2-3 topics viewers want to see next. Keep bullets concise. No text outside the JSON."""
+
+
+# Approximate prompt budget in tokens. Generation latency is linear in
+# context length, so packing by size beats a flat comments[:50] cut, which
+# wastes budget on short comments and can overflow on long ones. chars/4
+# tracks cl100k-style tokenizers closely enough for packing without
+# pulling in a tokenizer dependency.
+_PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 3500))
+
+
+def _pack_comments(comments, budget=None):
+    if budget is None:
+        budget = _PROMPT_TOKEN_BUDGET
+    packed = []
+    used = 0
+    for c in comments:
+        cost = len(c) // 4 + 1
+        if used + cost > budget:
+            break
+        packed.append(c)
+        used += cost
+    return packed
+
+
 def build_prompt(video, comments):
-    comments_str = "\n- ".join(comments[:50])
-    prompt = (
-        f"You are a YouTube comment analyzer. Analyze the following comments and provide insights.\n\n"
-        f"Video Title: {video['video_title']}\n"
-        f"Channel: {video['channelTitle']}\n"
-        f"Comments:\n{comments_str}\n\n"
-        "Analyze the comments and provide a response in this EXACT format:\n\n"
-        "PROS:\n"
-        "- List positive aspects mentioned by viewers\n"
-        "- Focus on content quality, presentation, accuracy\n\n"
-        "CONS:\n"
-        "- List criticisms and areas for improvement\n"
-        "- Focus on specific issues mentioned\n"
-        "- Do NOT include topic suggestions or requests for future videos here.\n"
-        "- If a viewer suggests a new topic, do NOT list it as a con.\n\n"
-        "NEXT HOT TOPIC:\n"
-        "- List 2-3 specific topics viewers want to see next\n"
-        "- Base these on questions and interests in comments\n"
-        "- Do NOT repeat cons. Only include new topic ideas here.\n\n"
-        "Keep each section concise with clear bullet points. No explanations needed."
-    )
-    #logger.info(f"Prompt built for video {video['video_id']} (first 300 chars): {prompt[:300]}")
+    # The whole prompt is one f-string so CPython builds it in a single pass.
+    comments_str = "\n- ".join(_pack_comments(comments))
+    prompt = f"""You are a YouTube comment analyzer. Analyze the following comments and provide insights.
+
+Video Title: {video['video_title']}
+Channel: {video['channelTitle']}
+Comments:
+{comments_str}
+
+Analyze the comments and provide a response in this EXACT format:
+
+PROS:
+- List positive aspects mentioned by viewers
+- Focus on content quality, presentation, accuracy
+
+CONS:
+- List criticisms and areas for improvement
+- Focus on specific issues mentioned
+- Do NOT include topic suggestions or requests for future videos here.
+- If a viewer suggests a new topic, do NOT list it as a con.
+
+NEXT HOT TOPIC:
+- List 2-3 specific topics viewers want to see next
+- Base these on questions and interests in comments
+- Do NOT repeat cons. Only include new topic ideas here.
+
+Keep each section concise with clear bullet points. No explanations needed."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Prompt built for video %s (first 300 chars): %.300s", video['video_id'], prompt)
     return prompt
 
 def extract_sections_from_text(text):
     # logger.info(f"Extracting sections from text (first 200 chars): {text[:200]}...")
     
-    # First try to parse as JSON if it looks like JSON
-    if '{' in text and '}' in text:
+    # First try to parse as JSON if it looks like JSON. raw_decode parses the
+    # object straight out of the surrounding prose in one pass, instead of the
+    # old find('{') + rfind('}') + substring copy before loads.
+    start = text.find('{')
+    if start != -1:
         try:
-            json_str = text[text.find('{'):text.rfind('}')+1]
-            result = json.loads(json_str)
+            result, _ = _JSON_DECODER.raw_decode(text, start)
             pros = result.get("pros", [])
             cons = result.get("cons", [])
             next_hot_topic = result.get("next_hot_topic", [])
@@ -189,18 +653,20 @@ def extract_sections_from_text(text):
                 cons = [cons]
             if isinstance(next_hot_topic, str):
                 next_hot_topic = [next_hot_topic]
-            # Remove overlap between cons and next_hot_topic
-            cons_clean = [c for c in cons if c.strip() and c.strip() not in next_hot_topic]
-            next_clean = [n for n in next_hot_topic if n.strip()]
+            # Remove overlap between cons and next_hot_topic; the set makes
+            # the containment check O(1) per con.
+            next_clean = _clean(next_hot_topic)
+            next_set = set(next_clean)
+            cons_clean = [c for c in _clean(cons) if c not in next_set]
             result = {
-                "pros": "\n".join([p.strip() for p in pros if p.strip()]),
+                "pros": "\n".join(_clean(pros)),
                 "cons": "\n".join(cons_clean),
                 "next_hot_topic": "\n".join(next_clean)
             }
             # logger.info(f"JSON parsing successful: pros={len(result['pros'])}, cons={len(result['cons'])}, next_hot_topic={len(result['next_hot_topic'])}")
             return result
-        except json.JSONDecodeError as e:
-            logger.warning(f"LLM API: JSON parsing failed: {e}")
+        except ValueError as e:
+            logger.warning("LLM API: JSON parsing failed: %s", e)
             pass
 
     # If JSON parsing fails, use regex to extract sections
@@ -208,18 +674,14 @@ def extract_sections_from_text(text):
     def extract_bullet_points(section_text):
         if not section_text:
             return []
-        points = re.findall(r'(?:^|\n)[•\-\*]\s*([^\n]+)', section_text, re.MULTILINE)
+        points = _BULLET_RE.findall(section_text)
         return [point.strip() for point in points] if points else [section_text.strip()]
 
-    pros_match = re.search(r"(?:PROS:|POSITIVE)[:\s]*(.*?)(?=(?:CONS:|NEXT HOT TOPIC:|$))", text, re.IGNORECASE | re.DOTALL)
-    cons_match = re.search(r"(?:CONS:|NEGATIVE)[:\s]*(.*?)(?=(?:PROS:|NEXT HOT TOPIC:|$))", text, re.IGNORECASE | re.DOTALL)
-    next_match = re.search(r"(?:NEXT HOT TOPIC|SUGGESTED TOPIC)[:\s]*(.*?)(?=(?:PROS:|CONS:|$))", text, re.IGNORECASE | re.DOTALL)
-    
-    # logger.info(f"Regex matches: pros={bool(pros_match)}, cons={bool(cons_match)}, next={bool(next_match)}")
-    
-    pros_list = extract_bullet_points(pros_match.group(1)) if pros_match else []
-    cons_list = extract_bullet_points(cons_match.group(1)) if cons_match else []
-    next_list = extract_bullet_points(next_match.group(1)) if next_match else []
+    sections = _split_sections(text)
+
+    pros_list = extract_bullet_points(sections.get("pros"))
+    cons_list = extract_bullet_points(sections.get("cons"))
+    next_list = extract_bullet_points(sections.get("next_hot_topic"))
     
     # Remove overlap between cons and next_hot_topic
     cons_clean = [c for c in cons_list if c and c not in next_list]
@@ -235,6 +697,6 @@ def extract_sections_from_text(text):
     
     # Log if all sections are empty after regex extraction
     if not result['pros'] and not result['cons'] and not result['next_hot_topic']:
-        logger.error(f"LLM API: All sections empty after regex extraction for text: {text[:200]}...")
+        logger.error("LLM API: All sections empty after regex extraction for text: %.200s...", text)
     
     return result 
\ No newline at end of file
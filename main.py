@@ -1,16 +1,285 @@
-from fastapi import FastAPI, HTTPException, Query, Header
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Header, Depends
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Optional, TypedDict
+import asyncio
 import logging
-from youtube_api import search_youtube_videos, fetch_top_comments
-from llm_analyzer import analyze_video_comments
-from db.supabase_client import insert_job_result
-from threading import Thread
+import os
+import time
+import orjson
+import httpx
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from youtube_api import (
+    search_youtube_videos,
+    search_youtube_videos_with_comments_async,
+    fetch_top_comments,
+    fetch_top_comments_async,
+    QuotaExceededError,
+)
+from llm_analyzer import analyze_video_comments, analyze_video_comments_async, analyze_videos_batch
+from db.supabase_client import insert_job_results
+from threading import Thread, Lock
+from queue import Queue, Empty
+from cachetools import TTLCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# How many videos are fetched + analyzed in parallel per job. Each video is
+# I/O-bound (YouTube comments + LLM call), so a small pool cuts job wall time
+# roughly by this factor while staying within YouTube quota.
+MAX_CONCURRENT_VIDEOS = int(os.environ.get("MAX_CONCURRENT_VIDEOS", 4))
+
+# Videos packed into one LLM prompt per round trip. 1 keeps the per-video
+# path; raising it trades some answer fidelity for far fewer generations.
+LLM_BATCH_SIZE = int(os.environ.get("LLM_BATCH_SIZE", 1))
+
+# Background jobs run on a fixed pool instead of one ad-hoc Thread per
+# request: bounded thread count under load (excess jobs queue), and
+# worker threads are reused instead of created and torn down per job.
+_JOB_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("JOB_WORKERS", 4)),
+    thread_name_prefix="analyzer",
+)
+
+class RateLimiter:
+    """Token-bucket limiter used as a plain (non-async) FastAPI dependency.
+
+    check_rate_limit is O(1) with no locks and no awaits: the refill
+    arithmetic is a handful of float operations that the GIL already
+    linearizes, so the dependency never stalls the event loop.
+    """
+
+    def __init__(self, rate_per_minute=60, burst=10):
+        self.rate = rate_per_minute / 60.0  # tokens per second
+        self.capacity = float(burst)
+        # Single service-wide bucket stored flat on the instance: the app
+        # rate-limits globally, so a per-client dict would only add hash
+        # lookups per request. If per-client limits are ever needed, add a
+        # dict of (tokens, last_ns) pairs then.
+        self.tokens = self.capacity
+        self.last_ns = time.monotonic_ns()
+
+    def check_rate_limit(self):
+        now = time.monotonic_ns()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_ns) * self.rate / 1e9)
+        self.last_ns = now
+        if self.tokens < 1.0:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded")
+        self.tokens -= 1.0
+
+
+rate_limiter = RateLimiter(
+    rate_per_minute=int(os.environ.get("RATE_LIMIT_PER_MINUTE", 60)),
+    burst=int(os.environ.get("RATE_LIMIT_BURST", 10)),
+)
+
+
+# NDJSON stream tuning: frames are coalesced in a bytearray and flushed once
+# the buffer passes this size or age, so bursts of small status updates cost
+# one TCP write instead of one per frame.
+_STREAM_FLUSH_BYTES = 4096
+_STREAM_FLUSH_SECONDS = 0.1
+
+
+class StreamFrame(TypedDict, total=False):
+    """Shape of the NDJSON progress frames emitted by /analyze-youtube-stream.
+
+    Frames are deliberately plain dicts — the producer controls every field,
+    so there is nothing for a model to validate per frame; this TypedDict
+    exists purely for static type checking and documentation.
+    """
+    status: str
+    current_video: int
+    total_videos: int
+    video_id: str
+    video_title: str
+    result: dict
+    error_message: str
+    running_totals: dict
+    job_id: str
+
+# Completed analyses keyed by the search parameters. Dashboards and UI
+# retries tend to resubmit identical searches; a repeat job inside the TTL
+# replays the cached (video, analysis) pairs into the new job's rows instead
+# of re-running the whole YouTube + LLM pipeline. Per-key locks make
+# concurrent duplicates wait for the first job instead of racing upstream.
+_results_cache = TTLCache(maxsize=128, ttl=int(os.environ.get("RESULTS_CACHE_TTL", 600)))
+_results_cache_lock = Lock()
+_inflight_locks = {}
+
+# Queries known to return zero videos. Each repeat of a failing query would
+# otherwise burn a search quota unit; remember emptiness briefly instead.
+_empty_search_cache = TTLCache(maxsize=1024, ttl=60)
+
+
+def _known_empty(query, order, regionCode):
+    with _results_cache_lock:
+        return (query, order, regionCode) in _empty_search_cache
+
+
+def _remember_empty(query, order, regionCode):
+    with _results_cache_lock:
+        _empty_search_cache[(query, order, regionCode)] = True
+
+
+def _has_content(analysis):
+    return bool(analysis.get('pros') or analysis.get('cons') or analysis.get('next_hot_topic'))
+
+
+def _flush_results(job_id, rows):
+    """Bulk-insert accumulated (video, analysis) rows. Returns rows written."""
+    if not rows:
+        return 0
+    try:
+        insert_job_results(job_id, rows)
+        return len(rows)
+    except Exception as db_exc:
+        logger.error(f"❌ Failed to insert {len(rows)} results for job {job_id}: {db_exc}")
+        return 0
+
+
+# How many finished videos accumulate before their rows are written out
+# mid-job, so the UI sees partial progress on long jobs instead of one
+# insert at the very end.
+_FLUSH_EVERY = int(os.environ.get("RESULTS_FLUSH_EVERY", 5))
+
+# HTTP/2 lets every concurrent googleapis/OpenRouter request in a job
+# multiplex over one TLS connection instead of opening its own. Needs the
+# httpx[http2] extra (the h2 package); fall back to HTTP/1.1 keep-alive
+# where it isn't installed.
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# uvloop's C event loop cuts per-request syscall and callback overhead for
+# the asyncio.run calls the job workers make. uvicorn already uses it for
+# the server loop when installed; this makes the background loops match.
+# Optional — Windows and bare dev environments fall back to the default
+# loop.
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
+_CLIENT_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
+
+async def _search_and_analyze(query, maxResults, order, regionCode, youtube_token, on_batch=None):
+    """Runs a whole job — search, comment fetches, LLM analysis — on one
+    event loop and one httpx client, so the search call's warm connection is
+    reused by everything after it. Returns (videos, outcomes); outcomes is
+    empty when the search found nothing, and videos is None when the search
+    itself failed rather than finding nothing."""
+    async with httpx.AsyncClient(http2=_HTTP2, limits=_CLIENT_LIMITS,
+                                 timeout=httpx.Timeout(180.0, connect=10.0)) as client:
+        videos, comments_by_id = await search_youtube_videos_with_comments_async(
+            client, query, maxResults, order, regionCode, youtube_token)
+        if not videos:
+            return videos, []
+        return videos, await _analyze_videos(client, videos, youtube_token, on_batch,
+                                             prefetched=comments_by_id)
+
+
+async def _analyze_videos(client, videos, youtube_token, on_batch=None, prefetched=None):
+    """Fetches comments and runs LLM analysis for all videos concurrently,
+    bounded by MAX_CONCURRENT_VIDEOS. Returns a list of (video, analysis)
+    pairs and/or exceptions. On quota exhaustion the stop flag makes
+    not-yet-started videos fail fast instead of burning further quota.
+
+    When on_batch is given, every _FLUSH_EVERY completed videos with
+    content are handed to it (in a worker thread) as the job runs, so rows
+    land while later videos are still in flight.
+
+    prefetched maps video_id -> comments fetched during the search stage;
+    videos found there skip their commentThreads call entirely."""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_VIDEOS)
+    stop = asyncio.Event()
+    async def fetch_one(video):
+        if prefetched is not None:
+            comments = prefetched.get(video['video_id'])
+            if comments is not None:
+                return video, comments
+        async with sem:
+            if stop.is_set():
+                raise QuotaExceededError("YouTube quota exhausted earlier in this job")
+            try:
+                return video, await fetch_top_comments_async(client, video['video_id'], 50, youtube_token)
+            except QuotaExceededError:
+                stop.set()
+                raise
+
+    async def one(video):
+        video, comments = await fetch_one(video)
+        return video, await analyze_video_comments_async(client, video, comments)
+
+    if LLM_BATCH_SIZE > 1:
+        # Batched mode: fetch all comment sets concurrently, then pack
+        # LLM_BATCH_SIZE videos per LLM round trip in a worker thread.
+        fetched = await asyncio.gather(*(fetch_one(video) for video in videos), return_exceptions=True)
+        good = [f for f in fetched if not isinstance(f, BaseException)]
+        analyzed = await asyncio.to_thread(analyze_videos_batch, good, LLM_BATCH_SIZE)
+        if on_batch is not None:
+            ready = [(video, analysis) for video, analysis in analyzed if _has_content(analysis)]
+            if ready:
+                await asyncio.to_thread(on_batch, ready)
+        by_id = {video['video_id']: (video, analysis) for video, analysis in analyzed}
+        return [f if isinstance(f, BaseException) else by_id[f[0]['video_id']] for f in fetched]
+
+    tasks = [asyncio.ensure_future(one(video)) for video in videos]
+    outcomes = []
+    ready = []
+    for future in asyncio.as_completed(tasks):
+        try:
+            outcome = await future
+        except Exception as exc:
+            outcomes.append(exc)
+            continue
+        outcomes.append(outcome)
+        if on_batch is not None and _has_content(outcome[1]):
+            ready.append(outcome)
+            if len(ready) >= _FLUSH_EVERY:
+                batch, ready = ready, []
+                await asyncio.to_thread(on_batch, batch)
+    if on_batch is not None and ready:
+        await asyncio.to_thread(on_batch, ready)
+    return outcomes
+
+
+# Stream-path DB writer tuning: rows are batched and written every few
+# items or half-second, off the path that feeds frames to the client.
+_DB_FLUSH_ITEMS = 5
+_DB_FLUSH_SECONDS = 0.5
+
+
+def _db_writer(job_id, rows_queue):
+    """Drains (video, analysis) rows from rows_queue and bulk-inserts them in
+    small batches until it receives the None sentinel. Runs on its own
+    thread so Supabase round trips never gate progress frames."""
+    batch = []
+    last_flush = time.monotonic()
+    while True:
+        try:
+            item = rows_queue.get(timeout=_DB_FLUSH_SECONDS)
+        except Empty:
+            item = Empty
+        if item is None:
+            break
+        if item is not Empty:
+            batch.append(item)
+        now = time.monotonic()
+        if batch and (len(batch) >= _DB_FLUSH_ITEMS or now - last_flush >= _DB_FLUSH_SECONDS):
+            _flush_results(job_id, batch)
+            batch = []
+            last_flush = now
+    if batch:
+        _flush_results(job_id, batch)
+
+# orjson serializes responses several times faster than the stdlib json
+# encoder FastAPI uses by default.
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -28,11 +297,11 @@ app.add_middleware(
 def health_check():
     return {"status": "ok"}
 
-@app.get("/analyze-youtube")
+@app.get("/analyze-youtube", dependencies=[Depends(rate_limiter.check_rate_limit)])
 def analyze_youtube(
-    query: str = Query(...),
+    query: str = Query(..., min_length=1, max_length=500),
     maxResults: int = Query(5, ge=1, le=50),
-    order: str = Query("relevance"),
+    order: str = Query("relevance", pattern=r"^(date|rating|relevance|title|videoCount|viewCount)$"),
     regionCode: Optional[str] = Query(None),
     topic: Optional[str] = Query(None),
     job_id: str = Query(...),  # keep it str or UUID
@@ -49,31 +318,238 @@ def analyze_youtube(
 
     # Run background job using a thread
     def run_analysis():
+        cache_key = (query, maxResults, order, regionCode)
+        with _results_cache_lock:
+            key_lock = _inflight_locks.setdefault(cache_key, Lock())
         try:
-            videos = search_youtube_videos(query, maxResults, order, regionCode, youtube_token)
-            # logger.info(f"🔍 Found {len(videos)} videos.")
+            with key_lock:
+                with _results_cache_lock:
+                    cached = _results_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"♻️ Reusing cached analysis for '{query}' ({len(cached)} videos)")
+                    rows = [(video, analysis) for video, analysis in cached if _has_content(analysis)]
+                    inserted = _flush_results(job_id, rows)
+                    logger.info(f"🏁 Job {job_id} done (cached): {inserted}/{len(cached)} videos inserted")
+                    return
 
-            for idx, video in enumerate(videos):
-                # logger.info(f"▶️ Analyzing video {idx + 1}/{len(videos)}: {video['video_title']}")
+                if _known_empty(query, order, regionCode):
+                    logger.info(f"🚫 Query '{query}' recently returned no videos; skipping search")
+                    return
 
-                comments = fetch_top_comments(video['video_id'], 50, youtube_token)
-                analysis = analyze_video_comments(video, comments)
-
-                # Check if analysis was successful (has content in pros, cons, or next_hot_topic)
-                has_content = (analysis.get('pros') or analysis.get('cons') or analysis.get('next_hot_topic'))
-                
-                if has_content:
-                    try:
-                        insert_job_result(job_id, video, analysis)
-                        # logger.info(f"✅ Inserted result for video {video['video_id']}")
-                    except Exception as db_exc:
-                        logger.error(f"❌ Failed to insert result for {video['video_id']}: {db_exc}")
-                else:
-                    logger.warning(f"⚠️ Skipping database insert for video {video['video_id']} - no analysis content (reason: {analysis.get('reason', 'Unknown')})")
+                # The whole job — search, comment fetches, analysis — runs
+                # on one event loop inside this worker thread: all videos in
+                # flight concurrently, one shared HTTP client. Rows are
+                # bulk-inserted in waves of _FLUSH_EVERY as videos finish,
+                # so the UI sees partial progress on long jobs.
+                inserted_counts = []
+
+                def flush_batch(batch):
+                    inserted_counts.append(_flush_results(job_id, batch))
+
+                videos, outcomes = asyncio.run(
+                    _search_and_analyze(query, maxResults, order, regionCode, youtube_token, on_batch=flush_batch)
+                )
+                if videos is None:
+                    # Search failure (API error, remembered 429/404) — not
+                    # proof the query is empty, so leave it uncached and
+                    # let the next identical search retry.
+                    logger.warning(f"⚠️ Search failed for query '{query}'")
+                    return
+                if not videos:
+                    _remember_empty(query, order, regionCode)
+                    logger.warning(f"⚠️ No videos found for query '{query}'")
+                    return
+                pairs = []
+                failed = 0
+                quota_exhausted = False
+                for outcome in outcomes:
+                    if isinstance(outcome, QuotaExceededError):
+                        if not quota_exhausted:
+                            logger.error(f"🛑 Aborting job {job_id}, YouTube quota exhausted: {outcome}")
+                        quota_exhausted = True
+                        continue
+                    if isinstance(outcome, BaseException):
+                        logger.error(f"❌ Video analysis task failed: {outcome}")
+                        failed += 1
+                        continue
+                    video, analysis = outcome
+                    pairs.append((video, analysis))
+                    if not _has_content(analysis):
+                        logger.warning(f"⚠️ Skipping database insert for video {video['video_id']} - no analysis content (reason: {analysis.get('reason', 'Unknown')})")
+
+                inserted = sum(inserted_counts)
+                # Only clean, non-empty runs are worth replaying — caching
+                # a job degraded by failed videos (or one that produced
+                # nothing) would serve the degraded result for the whole
+                # TTL window instead of letting the next search retry.
+                if not quota_exhausted and failed == 0 and pairs:
+                    with _results_cache_lock:
+                        _results_cache[cache_key] = pairs
+                logger.info(f"🏁 Job {job_id} done: {inserted}/{len(videos)} videos inserted, {failed} failed")
 
         except Exception as e:
             logger.exception(f"🚨 Analysis error: {e}")
+        finally:
+            # Per-key locks would otherwise accumulate forever, one per
+            # unique search. Drop the entry once no job holds it; a waiter
+            # that grabbed the Lock object before the drop still works, it
+            # just re-creates the entry's successor when it finishes.
+            with _results_cache_lock:
+                if _inflight_locks.get(cache_key) is key_lock and not key_lock.locked():
+                    del _inflight_locks[cache_key]
 
-    Thread(target=run_analysis).start()
+    _JOB_EXECUTOR.submit(run_analysis)
 
     return {"status": "started", "job_id": job_id}
+
+
+@app.get("/analyze-youtube-stream", dependencies=[Depends(rate_limiter.check_rate_limit)])
+async def analyze_youtube_stream(
+    query: str = Query(..., min_length=1, max_length=500),
+    maxResults: int = Query(5, ge=1, le=50),
+    order: str = Query("relevance", pattern=r"^(date|rating|relevance|title|videoCount|viewCount)$"),
+    regionCode: Optional[str] = Query(None),
+    topic: Optional[str] = Query(None),
+    job_id: str = Query(...),
+    authorization: Optional[str] = Header(None)
+):
+    """Same pipeline as /analyze-youtube, but streams per-video progress as
+    NDJSON (one JSON object per line) instead of running as a
+    fire-and-forget background job. Frames are flushed at least every
+    100ms, so clients still see progress in near real time."""
+
+    if authorization is None or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+
+    youtube_token = authorization.split(" ")[1]
+    logger.info(f"✅ Received stream request to analyze: '{query}' with job_id: {job_id}")
+
+    async def generate_stream():
+        loop = asyncio.get_running_loop()
+        # The analysis runs in a worker thread and pushes progress frames
+        # onto this queue; the generator drains it and yields NDJSON lines as
+        # they arrive, so the client sees progress in real time instead of
+        # one blob at the end.
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def emit(frame: StreamFrame):
+            loop.call_soon_threadsafe(queue.put_nowait, frame)
+
+        def produce():
+            if _known_empty(query, order, regionCode):
+                logger.info(f"🚫 Query '{query}' recently returned no videos; skipping search")
+                emit({"status": "videos_found", "total_videos": 0})
+                return
+            videos = search_youtube_videos(query, maxResults, order, regionCode, youtube_token)
+            if videos is None:
+                # Failure, not emptiness — don't mark the query known-empty.
+                logger.warning(f"⚠️ Search failed for query '{query}'")
+                videos = []
+            elif not videos:
+                _remember_empty(query, order, regionCode)
+            total = len(videos)
+            emit({"status": "videos_found", "total_videos": total})
+            def analyze_one(video):
+                emit({
+                    "status": "fetching_comments",
+                    "total_videos": total,
+                    "video_id": video["video_id"],
+                    "video_title": video["video_title"],
+                })
+                comments = fetch_top_comments(video['video_id'], 50, youtube_token)
+                emit({
+                    "status": "analyzing_comments",
+                    "total_videos": total,
+                    "video_id": video["video_id"],
+                    "video_title": video["video_title"],
+                })
+                return analyze_video_comments(video, comments)
+
+            # Videos run concurrently and each result frame is emitted the
+            # moment its video finishes, so the client can render video 1
+            # while video N is still being analyzed. Running totals ride
+            # along on each frame for a "N succeeded so far" signal.
+            # Rows go to a background writer so DB latency never delays a
+            # frame; the writer is joined before returning so the final
+            # "finished" frame means everything is actually stored.
+            rows_queue = Queue()
+            writer = Thread(target=_db_writer, args=(job_id, rows_queue), daemon=True)
+            writer.start()
+            success = errors = completed = 0
+            try:
+                with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_VIDEOS) as pool:
+                    futures = {pool.submit(analyze_one, video): video for video in videos}
+                    for future in as_completed(futures):
+                        video = futures[future]
+                        completed += 1
+                        try:
+                            analysis = future.result()
+                        except QuotaExceededError as exc:
+                            logger.error(f"🛑 Aborting stream job {job_id}, YouTube quota exhausted: {exc}")
+                            for pending in futures:
+                                pending.cancel()
+                            emit({
+                                "status": "error",
+                                "total_videos": total,
+                                "error_message": f"YouTube quota exhausted: {exc}",
+                                "running_totals": {"success": success, "errors": errors},
+                            })
+                            break
+                        except Exception as exc:
+                            logger.error(f"❌ Video analysis task failed for {video['video_id']}: {exc}")
+                            errors += 1
+                            emit({
+                                "status": "error",
+                                "current_video": completed,
+                                "total_videos": total,
+                                "video_id": video["video_id"],
+                                "video_title": video["video_title"],
+                                "error_message": str(exc),
+                                "running_totals": {"success": success, "errors": errors},
+                            })
+                            continue
+
+                        has_content = _has_content(analysis)
+                        if has_content:
+                            success += 1
+                            rows_queue.put((video, analysis))
+                        else:
+                            errors += 1
+                        emit({
+                            "status": "completed" if has_content else "error",
+                            "current_video": completed,
+                            "total_videos": total,
+                            "video_id": video["video_id"],
+                            "video_title": video["video_title"],
+                            "result": analysis,
+                            "running_totals": {"success": success, "errors": errors},
+                        })
+
+            finally:
+                rows_queue.put(None)
+                writer.join()
+        task = loop.run_in_executor(None, produce)
+        buf = bytearray()
+        last_flush = time.monotonic()
+        while not task.done() or not queue.empty():
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout=_STREAM_FLUSH_SECONDS)
+                buf += orjson.dumps(frame)
+                buf += b"\n"
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            if buf and (len(buf) >= _STREAM_FLUSH_BYTES or now - last_flush >= _STREAM_FLUSH_SECONDS):
+                yield bytes(buf)
+                buf.clear()
+                last_flush = now
+        try:
+            await task
+            buf += orjson.dumps({'status': 'finished', 'job_id': job_id})
+        except Exception as exc:
+            logger.exception(f"🚨 Stream analysis error: {exc}")
+            buf += orjson.dumps({'status': 'error', 'job_id': job_id, 'error_message': str(exc)})
+        buf += b"\n"
+        yield bytes(buf)
+
+    return StreamingResponse(generate_stream(), media_type="application/x-ndjson")
@@ -3,4 +3,16 @@ import uvicorn
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))  # 8000 for local, $PORT for Render
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file
+    debug = os.environ.get("DEBUG", "").lower() in ("1", "true", "yes")
+    # uvloop + httptools swap in C implementations of the event loop and HTTP
+    # parser — same app code, noticeably higher throughput for this I/O-bound
+    # service. Multiple workers only in production; --reload needs one process.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=None if debug else (os.cpu_count() or 1),
+        reload=debug,
+    )
@@ -0,0 +1,50 @@
+"""Unit tests for the LLM response section extraction."""
+from llm_analyzer import extract_sections_from_text, _sections_complete, _split_sections
+
+
+def test_sections_survive_positive_negative_in_bodies():
+    # "positive"/"negative" inside bullet bodies must not be mistaken for
+    # section headers and truncate the enclosing section.
+    text = """PROS:
+- Viewers appreciate the positive tone of the video
+- Great editing throughout
+
+CONS:
+- Some negative feedback about audio quality
+
+NEXT HOT TOPIC:
+- A deep dive on lighting setups
+"""
+    result = extract_sections_from_text(text)
+    assert "positive tone of the video" in result["pros"]
+    assert "Great editing throughout" in result["pros"]
+    assert result["cons"] == "Some negative feedback about audio quality"
+    assert result["next_hot_topic"] == "A deep dive on lighting setups"
+
+
+def test_synonym_headers_map_to_canonical_sections():
+    text = "POSITIVES:\n- good pacing\nNEGATIVES:\n- too long\nSUGGESTED TOPICS:\n- part two\n"
+    sections = _split_sections(text)
+    assert sections.keys() == {"pros", "cons", "next_hot_topic"}
+    result = extract_sections_from_text(text)
+    assert result == {"pros": "good pacing", "cons": "too long", "next_hot_topic": "part two"}
+
+
+def test_headers_require_line_anchor_and_colon():
+    # Mid-line or colon-less occurrences of header words are body text.
+    text = "PROS:\n- the cons mentioned were minor\n- POSITIVE overall\nCONS:\n- none\n"
+    sections = _split_sections(text)
+    assert "cons mentioned were minor" in sections["pros"]
+    assert "POSITIVE overall" in sections["pros"]
+    assert sections["cons"].strip() == "- none"
+
+
+def test_sections_complete_waits_for_final_section_body():
+    # The early-close check must not fire while NEXT HOT TOPIC is still
+    # streaming its first bullet.
+    partial = "PROS:\n- good\n\nCONS:\n- bad\n\nNEXT HOT TOPIC:\n- First topic about A"
+    assert not _sections_complete(partial)
+    two_bullets = partial + "\n- Second topic about B\n"
+    assert _sections_complete(two_bullets)
+    blank_line_close = partial + "\n\n"
+    assert _sections_complete(blank_line_close)
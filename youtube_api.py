@@ -1,7 +1,13 @@
 import os
+import asyncio
 import requests
+import httpx
+import orjson
 import logging
 import re
+import diskcache
+from threading import Lock
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,125 +15,319 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared session so the search -> videos -> commentThreads sequence (and
+# every call after it) reuses one keep-alive TLS connection to
+# googleapis.com instead of paying DNS + TCP + TLS setup per request.
+# Transient 5xx responses are retried at the HTTP layer with backoff
+# (these GETs are idempotent), so a blip doesn't surface as an empty
+# result and force the caller to rerun the whole pipeline. 429 is
+# deliberately not retried — the negative cache handles rate limiting.
+_RETRY = requests.adapters.Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(500, 502, 503, 504),
+    allowed_methods=frozenset(["GET"]),
+    respect_retry_after_header=True,
+)
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(
+    pool_connections=16, pool_maxsize=32, max_retries=_RETRY))
+
+# (connect, read) timeouts — googleapis answers fast or not at all.
+_TIMEOUT = (3, 10)
+
+# Persistent cache for YouTube Data API responses. Repeat queries (UI
+# navigation, retries, several users asking about the same topic) then
+# short-circuit the network entirely and spend no quota. Search results
+# go stale faster than a video's top comments, hence the split TTLs.
+_YT_CACHE = diskcache.Cache(os.environ.get("YT_CACHE_DIR", "/tmp/yt_cache"), size_limit=2**30)
+_SEARCH_CACHE_TTL = int(os.environ.get("YT_SEARCH_CACHE_TTL", 24 * 3600))
+_COMMENTS_CACHE_TTL = int(os.environ.get("YT_COMMENTS_CACHE_TTL", 7 * 24 * 3600))
+
+# Hot search keys resolve from this in-process layer before touching the
+# disk cache at all, skipping diskcache's file access and pickle round
+# trip. Guarded by a lock because the sync path runs on worker threads.
+_SEARCH_MEM_CACHE = TTLCache(maxsize=512, ttl=min(3600, _SEARCH_CACHE_TTL))
+_SEARCH_MEM_LOCK = Lock()
+
+
+def _cached_search(cache_key):
+    with _SEARCH_MEM_LOCK:
+        hit = _SEARCH_MEM_CACHE.get(cache_key)
+    if hit is not None:
+        return hit
+    hit = _YT_CACHE.get(cache_key)
+    if hit is not None:
+        with _SEARCH_MEM_LOCK:
+            _SEARCH_MEM_CACHE[cache_key] = hit
+    return hit
+
+
+def _store_search(cache_key, videos):
+    _YT_CACHE.set(cache_key, videos, expire=_SEARCH_CACHE_TTL)
+    with _SEARCH_MEM_LOCK:
+        _SEARCH_MEM_CACHE[cache_key] = videos
+
+# Partial-response masks (the API's `fields` parameter): the server strips
+# everything we never read, so responses shrink to the handful of fields
+# the parsers below actually touch — less bandwidth, less JSON to decode.
+_SEARCH_FIELDS = "items(id/kind,id/videoId)"
+_VIDEOS_FIELDS = ("items(id,snippet(title,channelTitle,publishedAt,"
+                  "thumbnails(high/url,default/url)),contentDetails/duration)")
+_COMMENTS_FIELDS = "items/snippet/topLevelComment/snippet/textOriginal,nextPageToken"
+
+_SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+_VIDEOS_URL = "https://www.googleapis.com/youtube/v3/videos"
+_COMMENTS_URL = "https://www.googleapis.com/youtube/v3/commentThreads"
+
+# Constant portion of each call's query params, built once; per-call
+# values are merged over these instead of rebuilding the whole literal.
+_SEARCH_BASE_PARAMS = {
+    "part": "snippet",
+    "type": "video",  # Ensures only videos are requested
+    "videoDuration": "long",
+    "fields": _SEARCH_FIELDS,
+}
+_VIDEOS_BASE_PARAMS = {"part": "snippet,contentDetails", "fields": _VIDEOS_FIELDS}
+_COMMENTS_BASE_PARAMS = {"part": "snippet", "order": "relevance", "fields": _COMMENTS_FIELDS}
+
+
+class QuotaExceededError(Exception):
+    """Raised when the YouTube API reports quota/rate-limit exhaustion.
+
+    Distinct from ordinary per-video failures (e.g. comments disabled) so
+    batch callers can stop issuing requests instead of burning the rest of
+    the quota window on calls that are guaranteed to fail.
+    """
+
+
+def _negative_cache(cache_key, resp):
+    """Remembers 429/404 responses so follow-up calls for the same key
+    short-circuit to [] instead of re-issuing requests that are guaranteed
+    to fail — repeating a 429 during a rate-limit window just compounds it.
+    A Retry-After header, when the API sends one, sets the exact TTL."""
+    if resp.status_code == 429:
+        ttl = 3600
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                ttl = max(1, int(retry_after))
+            except ValueError:
+                pass
+    elif resp.status_code == 404:
+        ttl = 86400
+    else:
+        return
+    _YT_CACHE.set(('neg',) + cache_key, [], expire=ttl)
+
+
+def _negative_cached(cache_key):
+    return _YT_CACHE.get(('neg',) + cache_key) is not None
+
+
+def _raise_if_quota_exhausted(resp):
+    if resp.status_code == 429:
+        raise QuotaExceededError("YouTube API rate limit exceeded (429)")
+    if resp.status_code == 403:
+        try:
+            reason = resp.json()["error"]["errors"][0]["reason"]
+        except (ValueError, KeyError, IndexError):
+            reason = ""
+        # 403 with commentsDisabled etc. is video-specific — let callers
+        # carry on; only quota-style reasons abort the batch.
+        if reason in ("quotaExceeded", "rateLimitExceeded", "dailyLimitExceeded"):
+            raise QuotaExceededError(f"YouTube API quota exhausted ({reason})")
+
+# ISO-8601 duration as YouTube emits it (PT#H#M#S, every part optional);
+# one precompiled pattern replaces three re.search scans per video.
+_DURATION_RE = re.compile(r'^PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$')
+
 def _parse_duration(duration_str: str) -> int:
-    if not duration_str or not duration_str.startswith('PT'):
+    m = _DURATION_RE.match(duration_str) if duration_str else None
+    if not m:
         return 0
-    duration_str = duration_str[2:]
-    total_seconds = 0
-    hours_match = re.search(r'(\d+)H', duration_str)
-    if hours_match:
-        total_seconds += int(hours_match.group(1)) * 3600
-    minutes_match = re.search(r'(\d+)M', duration_str)
-    if minutes_match:
-        total_seconds += int(minutes_match.group(1)) * 60
-    seconds_match = re.search(r'(\d+)S', duration_str)
-    if seconds_match:
-        total_seconds += int(seconds_match.group(1))
-    return total_seconds
-
-# def search_youtube_videos(query, maxResults=1, order="relevance", regionCode=None, youtube_token=None):
+    hours, minutes, seconds = m.groups()
+    return ((int(hours) if hours else 0) * 3600
+            + (int(minutes) if minutes else 0) * 60
+            + (int(seconds) if seconds else 0))
+
+def search_youtube_videos(query, maxResults=1, order="relevance", regionCode=None, youtube_token=None):
+    """Returns the matching videos, [] when the search genuinely found
+    nothing, or None when the call itself failed (missing auth, API error,
+    or a remembered 429/404) — so callers don't treat a transient failure
+    as proof the query has no results."""
     if not youtube_token:
-        logger.error("Missing YouTube OAuth token")
-        return []
+        logger.error("YouTube API: Missing YouTube OAuth token")
+        return None
+
+    cache_key = ('search', query, maxResults, order, regionCode)
+    cached = _cached_search(cache_key)
+    if cached is not None:
+        return cached
+    if _negative_cached(cache_key):
+        return None
 
     headers = {
         "Authorization": f"Bearer {youtube_token}",
         "Accept": "application/json"
     }
 
-    search_url = "https://www.googleapis.com/youtube/v3/search"
     search_params = {
-        "part": "snippet",
+        **_SEARCH_BASE_PARAMS,
         "q": query,
-        "type": "video",
         "maxResults": min(50, maxResults * 2),
         "order": order,
-        "videoDuration": "medium"
     }
+
     if regionCode:
         search_params["regionCode"] = regionCode
 
-    # logger.info(f"YouTube Search API request: {search_url} params={search_params}")
-    search_resp = requests.get(search_url, headers=headers, params=search_params)
-    # logger.info(f"YouTube Search API response status: {search_resp.status_code}")
+    # logger.info(f"YouTube API: Search request: {search_url} params={search_params}")
+    search_resp = _SESSION.get(_SEARCH_URL, headers=headers, params=search_params, timeout=_TIMEOUT)
+    # logger.info(f"YouTube API: Search response status: {search_resp.status_code}")
+    
     if search_resp.status_code != 200:
-        logger.error(f"YouTube API error: {search_resp.text}")
+        _negative_cache(cache_key, search_resp)
+        logger.error("YouTube API: Search API error: %s", search_resp.text)
+        return None
+
+    search_items = orjson.loads(search_resp.content).get("items", [])
+
+    if not search_items:
+        logger.warning("YouTube API: No search results found for query: %s", query)
         return []
 
-    video_ids = [item["id"]["videoId"] for item in search_resp.json().get("items", [])]
+    # logger.info(f"YouTube API: Found {len(search_items)} search results for query: {query}")
+
+    # ✅ Safe videoId extraction
+    video_ids = [
+        item["id"]["videoId"]
+        for item in search_items
+        if item.get("id", {}).get("kind") == "youtube#video" and "videoId" in item["id"]
+    ]
+
     if not video_ids:
+        logger.warning("YouTube API: No valid video IDs found in search results.")
         return []
 
-    videos_url = "https://www.googleapis.com/youtube/v3/videos"
-    videos_params = {
-        "part": "snippet,contentDetails",
-        "id": ",".join(video_ids)
-    }
-    videos_resp = requests.get(videos_url, headers=headers, params=videos_params)
+    # logger.info(f"YouTube API: Extracted {len(video_ids)} valid video IDs")
+
+    # Dedupe (order-preserving) and cap at the API's 50-id limit so the
+    # joined id= param can't overflow and fail the whole call.
+    video_ids = list(dict.fromkeys(video_ids))[:50]
+
+    videos_params = {**_VIDEOS_BASE_PARAMS, "id": ",".join(video_ids)}
+
+    videos_resp = _SESSION.get(_VIDEOS_URL, headers=headers, params=videos_params, timeout=_TIMEOUT)
+    # logger.info(f"YouTube API: Videos response status: {videos_resp.status_code}")
+    
     if videos_resp.status_code != 200:
-        logger.error(f"YouTube Videos API error: {videos_resp.text}")
-        return []
+        _negative_cache(cache_key, videos_resp)
+        logger.error("YouTube API: Videos API error: %s", videos_resp.text)
+        return None
 
     final_videos = []
-    for item in videos_resp.json().get("items", []):
-        # duration_seconds = _parse_duration(item.get("contentDetails", {}).get("duration"))
-        # if duration_seconds < 300:  # Skip videos less than 5 minutes
-        #     continue
+    for item in orjson.loads(videos_resp.content).get("items", []):
+        snippet = item.get("snippet", {})
+        # EAFP: nearly every video has a high thumbnail, so the common
+        # path is two plain lookups with no intermediate defaults built.
+        thumbnails = snippet.get("thumbnails", {})
+        try:
+            thumbnail_url = thumbnails["high"]["url"]
+        except KeyError:
+            try:
+                thumbnail_url = thumbnails["default"]["url"]
+            except KeyError:
+                thumbnail_url = ""
 
-        snippet = item["snippet"]
         final_videos.append({
-            "video_id": item["id"],
-            "video_title": snippet["title"],
-            "channelTitle": snippet["channelTitle"],
-            "thumbnail_url": snippet["thumbnails"].get("high", snippet["thumbnails"]["default"])['url'],
-            "publishTime": snippet.get("publishTime", snippet.get("publishedAt", ""))
+            "video_id": item.get("id"),
+            "video_title": snippet.get("title", "No Title"),
+            "channelTitle": snippet.get("channelTitle", "Unknown Channel"),
+            "thumbnail_url": thumbnail_url,
+            "publishTime": snippet.get("publishTime") or snippet.get("publishedAt", "")
         })
+
         if len(final_videos) >= maxResults:
             break
 
-    # logger.info(f"YouTube Search API returned {len(final_videos)} videos after filtering.")
+    # logger.info(f"YouTube API: Search returned {len(final_videos)} videos after filtering.")
+    _store_search(cache_key, final_videos)
     return final_videos
 
-def search_youtube_videos(query, maxResults=1, order="relevance", regionCode=None, youtube_token=None):
-    if not youtube_token:
-        logger.error("YouTube API: Missing YouTube OAuth token")
-        return []
-
-    headers = {
-        "Authorization": f"Bearer {youtube_token}",
-        "Accept": "application/json"
-    }
 
-    search_url = "https://www.googleapis.com/youtube/v3/search"
+# In-flight deduplication for the async paths: when an identical request
+# is already on the wire (debounced UI firing the same search twice,
+# several jobs wanting the same video's comments), later callers await
+# the first call's future instead of issuing a duplicate — N concurrent
+# duplicates collapse to one API call and one quota debit. Keys include
+# the owning event loop, so jobs on different loops never share futures.
+_INFLIGHT = {}
+
+
+async def _single_flight(key, make_request):
+    # Futures are bound to one event loop, and every background job runs
+    # its own (asyncio.run on a worker thread) — so dedup is scoped per
+    # loop. Awaiting another loop's future would raise "got Future
+    # attached to a different loop" and silently drop the video.
+    loop = asyncio.get_running_loop()
+    key = (loop, key)
+    fut = _INFLIGHT.get(key)
+    if fut is not None:
+        return await fut
+    fut = loop.create_future()
+    _INFLIGHT[key] = fut
+    try:
+        result = await make_request()
+    except BaseException as exc:
+        fut.set_exception(exc)
+        fut.exception()  # mark retrieved so lone failures don't warn at GC
+        raise
+    else:
+        fut.set_result(result)
+        return result
+    finally:
+        _INFLIGHT.pop(key, None)
+
+
+async def search_youtube_videos_async(client: httpx.AsyncClient, query, maxResults=1, order="relevance", regionCode=None, youtube_token=None):
+    """Async variant of search_youtube_videos. Same two-call flow
+    (search -> videos details), the same result shape, and the same
+    None-on-failure / []-when-empty contract; run on the shared httpx
+    client so the details call reuses the search call's connection.
+    Identical concurrent searches are collapsed into one API call."""
+    key = ('search', query, maxResults, order, regionCode)
+    return await _single_flight(
+        key, lambda: _search_youtube_videos(client, query, maxResults, order, regionCode, youtube_token))
+
+
+async def _search_video_ids(client, query, maxResults, order, regionCode, cache_key, headers):
+    """First hop of the async search: returns candidate video ids, or None
+    when the search call itself failed (so callers don't cache the miss)."""
     search_params = {
-        "part": "snippet",
+        **_SEARCH_BASE_PARAMS,
         "q": query,
-        "type": "video",  # Ensures only videos are requested
         "maxResults": min(50, maxResults * 2),
         "order": order,
-        "videoDuration": "long"
     }
 
     if regionCode:
         search_params["regionCode"] = regionCode
 
-    # logger.info(f"YouTube API: Search request: {search_url} params={search_params}")
-    search_resp = requests.get(search_url, headers=headers, params=search_params)
-    # logger.info(f"YouTube API: Search response status: {search_resp.status_code}")
-    
+    search_resp = await client.get(_SEARCH_URL, headers=headers, params=search_params)
+
     if search_resp.status_code != 200:
-        logger.error(f"YouTube API: Search API error: {search_resp.text}")
-        return []
+        _negative_cache(cache_key, search_resp)
+        _raise_if_quota_exhausted(search_resp)
+        logger.error("YouTube API: Search API error: %s", search_resp.text)
+        return None
+
+    search_items = orjson.loads(search_resp.content).get("items", [])
 
-    search_items = search_resp.json().get("items", [])
-    
     if not search_items:
-        logger.warning(f"YouTube API: No search results found for query: {query}")
+        logger.warning("YouTube API: No search results found for query: %s", query)
         return []
 
-    # logger.info(f"YouTube API: Found {len(search_items)} search results for query: {query}")
-
-    # ✅ Safe videoId extraction
     video_ids = [
         item["id"]["videoId"]
         for item in search_items
@@ -136,94 +336,331 @@ def search_youtube_videos(query, maxResults=1, order="relevance", regionCode=Non
 
     if not video_ids:
         logger.warning("YouTube API: No valid video IDs found in search results.")
-        return []
+    # Dedupe (order-preserving) and cap at the API's 50-id limit so the
+    # videos.list id= param downstream can't overflow and fail the call.
+    return list(dict.fromkeys(video_ids))[:50]
 
-    # logger.info(f"YouTube API: Extracted {len(video_ids)} valid video IDs")
 
-    videos_url = "https://www.googleapis.com/youtube/v3/videos"
-    videos_params = {
-        "part": "snippet,contentDetails",
-        "id": ",".join(video_ids)
-    }
+async def _video_details(client, video_ids, maxResults, cache_key, headers):
+    """Second hop: videos.list details for the candidate ids, trimmed to
+    maxResults. Returns None when the API call failed."""
+    videos_params = {**_VIDEOS_BASE_PARAMS, "id": ",".join(video_ids)}
+
+    videos_resp = await client.get(_VIDEOS_URL, headers=headers, params=videos_params)
 
-    videos_resp = requests.get(videos_url, headers=headers, params=videos_params)
-    # logger.info(f"YouTube API: Videos response status: {videos_resp.status_code}")
-    
     if videos_resp.status_code != 200:
-        logger.error(f"YouTube API: Videos API error: {videos_resp.text}")
-        return []
+        _negative_cache(cache_key, videos_resp)
+        _raise_if_quota_exhausted(videos_resp)
+        logger.error("YouTube API: Videos API error: %s", videos_resp.text)
+        return None
 
     final_videos = []
-    for item in videos_resp.json().get("items", []):
+    for item in orjson.loads(videos_resp.content).get("items", []):
         snippet = item.get("snippet", {})
+        # EAFP: nearly every video has a high thumbnail, so the common
+        # path is two plain lookups with no intermediate defaults built.
         thumbnails = snippet.get("thumbnails", {})
-        thumbnail_url = thumbnails.get("high", thumbnails.get("default", {})).get("url", "")
+        try:
+            thumbnail_url = thumbnails["high"]["url"]
+        except KeyError:
+            try:
+                thumbnail_url = thumbnails["default"]["url"]
+            except KeyError:
+                thumbnail_url = ""
 
         final_videos.append({
             "video_id": item.get("id"),
             "video_title": snippet.get("title", "No Title"),
             "channelTitle": snippet.get("channelTitle", "Unknown Channel"),
             "thumbnail_url": thumbnail_url,
-            "publishTime": snippet.get("publishTime", snippet.get("publishedAt", ""))
+            "publishTime": snippet.get("publishTime") or snippet.get("publishedAt", "")
         })
 
         if len(final_videos) >= maxResults:
             break
 
-    # logger.info(f"YouTube API: Search returned {len(final_videos)} videos after filtering.")
     return final_videos
 
 
-def fetch_top_comments(video_id, max_results=10, youtube_token=None):
+async def _search_youtube_videos(client, query, maxResults, order, regionCode, youtube_token):
     if not youtube_token:
         logger.error("YouTube API: Missing YouTube OAuth token")
+        return None
+
+    cache_key = ('search', query, maxResults, order, regionCode)
+    cached = _cached_search(cache_key)
+    if cached is not None:
+        return cached
+    if _negative_cached(cache_key):
+        return None
+
+    headers = {
+        "Authorization": f"Bearer {youtube_token}",
+        "Accept": "application/json"
+    }
+
+    video_ids = await _search_video_ids(client, query, maxResults, order, regionCode, cache_key, headers)
+    if video_ids is None:
+        return None
+    if not video_ids:
         return []
 
+    final_videos = await _video_details(client, video_ids, maxResults, cache_key, headers)
+    if final_videos is None:
+        return None
+
+    _store_search(cache_key, final_videos)
+    return final_videos
+
+
+async def search_youtube_videos_with_comments_async(client: httpx.AsyncClient, query, maxResults=1,
+                                                    order="relevance", regionCode=None, youtube_token=None,
+                                                    comments_per_video=50):
+    """Search plus comment prefetch in one awaited call. The videos.list
+    details request and the commentThreads fetches both depend only on the
+    ids from search, so they run concurrently instead of back to back,
+    overlapping the two googleapis round trips.
+
+    Returns (videos, comments_by_id). videos is None when the search
+    itself failed (missing auth, API error, or a remembered 429/404) as
+    opposed to genuinely finding nothing, so callers don't mistake a
+    transient failure for an empty query. comments_by_id can be missing
+    videos whose fetch failed (including the whole prefetch on quota
+    exhaustion); callers fall back to fetching those individually, which
+    re-raises quota errors through the usual per-video path."""
+    if not youtube_token:
+        logger.error("YouTube API: Missing YouTube OAuth token")
+        return None, {}
+
     headers = {
         "Authorization": f"Bearer {youtube_token}",
         "Accept": "application/json"
     }
 
-    url = f"https://www.googleapis.com/youtube/v3/commentThreads"
-    params = {
-        "part": "snippet",
-        "videoId": video_id,
-        "maxResults": max_results,
-        "order": "relevance"
+    cache_key = ('search', query, maxResults, order, regionCode)
+    cached = _cached_search(cache_key)
+    if cached is not None:
+        videos, video_ids = cached, [v["video_id"] for v in cached]
+    elif _negative_cached(cache_key):
+        return None, {}
+    else:
+        video_ids = await _search_video_ids(client, query, maxResults, order, regionCode, cache_key, headers)
+        if video_ids is None:
+            return None, {}
+        if not video_ids:
+            return [], {}
+        videos = None
+
+    # The details call only ever keeps the first maxResults ids, so the
+    # prefetch sticks to those and doesn't spend quota on the overflow.
+    wanted = video_ids[:maxResults]
+    comments_task = asyncio.ensure_future(
+        fetch_comments_bulk(client, wanted, youtube_token, comments_per_video))
+
+    if videos is None:
+        videos = await _video_details(client, video_ids, maxResults, cache_key, headers)
+        if videos is not None:
+            _store_search(cache_key, videos)
+
+    try:
+        comments_by_id = await comments_task
+    except QuotaExceededError:
+        # Don't fail the search for this — per-video fallbacks will hit
+        # the same quota wall and report it through the job's outcomes.
+        logger.warning("YouTube API: Comment prefetch aborted on quota exhaustion")
+        comments_by_id = {}
+
+    # videos stays None here when the details hop failed — propagate the
+    # distinction rather than collapsing it into an empty result.
+    return videos, comments_by_id
+
+
+def fetch_top_comments(video_id, max_results=10, youtube_token=None):
+    if not youtube_token:
+        logger.error("YouTube API: Missing YouTube OAuth token")
+        return []
+
+    headers = {
+        "Authorization": f"Bearer {youtube_token}",
+        "Accept": "application/json"
     }
 
-    # logger.info(f"YouTube API: Comments request: {url} with params={params}")
-    resp = requests.get(url, headers=headers, params=params)
-    # logger.info(f"YouTube API: Comments response status: {resp.status_code}")
-    
-    if resp.status_code != 200:
-        logger.error(f"YouTube API: Comments API error: {resp.text}")
+    cache_key = ('comments', video_id, max_results)
+    cached = _YT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    if _negative_cached(cache_key):
         return []
 
-    data = resp.json()
     comments = []
-    
-    # Check if response has items
-    items = data.get("items", [])
-    if not items:
-        logger.warning(f"YouTube API: No comments found for video {video_id}")
+    page_token = None
+    fetch_ok = True
+
+    # The API caps each page at 100 threads; follow nextPageToken until we
+    # have max_results comments or run out of pages. Page tokens are only
+    # handed out sequentially, so pages are fetched one after another.
+    while len(comments) < max_results:
+        params = {
+            **_COMMENTS_BASE_PARAMS,
+            "videoId": video_id,
+            "maxResults": min(100, max_results - len(comments)),
+        }
+        if page_token:
+            params["pageToken"] = page_token
+
+        # logger.info(f"YouTube API: Comments request: {url} with params={params}")
+        resp = _SESSION.get(_COMMENTS_URL, headers=headers, params=params, timeout=_TIMEOUT)
+        # logger.info(f"YouTube API: Comments response status: {resp.status_code}")
+
+        if resp.status_code != 200:
+            _negative_cache(cache_key, resp)
+            _raise_if_quota_exhausted(resp)
+            logger.error("YouTube API: Comments API error: %s", resp.text)
+            fetch_ok = False
+            break
+
+        data = orjson.loads(resp.content)
+        items = data.get("items", [])
+        if not items:
+            break
+
+        # One comprehension keeps the extract/strip/filter pass inside the
+        # C-level iterator instead of interpreted per-item appends. The
+        # fields mask guarantees the nested path, and the .get chain turns
+        # any malformed stragglers into empty strings the filter drops.
+        comments.extend(
+            text for text in (
+                item.get("snippet", {}).get("topLevelComment", {})
+                    .get("snippet", {}).get("textOriginal", "").strip()
+                for item in items
+            ) if text
+        )
+
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            break
+
+    if not comments:
+        logger.warning("YouTube API: No valid comments extracted for video %s", video_id)
+
+    # Only cache complete fetches — a partial list cut short by an API
+    # error should be retried, not served for a week.
+    if fetch_ok:
+        _YT_CACHE.set(cache_key, comments, expire=_COMMENTS_CACHE_TTL)
+
+    return comments
+
+
+async def fetch_top_comments_async(client: httpx.AsyncClient, video_id, max_results=10, youtube_token=None):
+    """Async variant of fetch_top_comments for callers running many videos
+    concurrently on an event loop. Same pagination and quota semantics; the
+    shared httpx client keeps connections warm across videos. Identical
+    concurrent fetches are collapsed into one API call."""
+    key = ('comments', video_id, max_results)
+    return await _single_flight(
+        key, lambda: _fetch_top_comments(client, video_id, max_results, youtube_token))
+
+
+async def _fetch_top_comments(client, video_id, max_results, youtube_token):
+    if not youtube_token:
+        logger.error("YouTube API: Missing YouTube OAuth token")
         return []
-    
-    # logger.info(f"YouTube API: Found {len(items)} comment threads for video {video_id}")
-    
-    for item in items:
-        try:
-            snippet = item["snippet"]["topLevelComment"]["snippet"]
-            text = snippet.get("textOriginal", "").strip()
-            if text:
-                comments.append(text)
-        except (KeyError, TypeError) as e:
-            logger.warning(f"YouTube API: Failed to extract comment text: {e}")
-            continue
-
-    # logger.info(f"YouTube API: Extracted {len(comments)} valid comments from {len(items)} threads for video {video_id}")
-    
+
+    headers = {
+        "Authorization": f"Bearer {youtube_token}",
+        "Accept": "application/json"
+    }
+
+    cache_key = ('comments', video_id, max_results)
+    cached = _YT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    if _negative_cached(cache_key):
+        return []
+
+    comments = []
+    page_token = None
+    fetch_ok = True
+
+    while len(comments) < max_results:
+        params = {
+            **_COMMENTS_BASE_PARAMS,
+            "videoId": video_id,
+            "maxResults": min(100, max_results - len(comments)),
+        }
+        if page_token:
+            params["pageToken"] = page_token
+
+        resp = await client.get(_COMMENTS_URL, headers=headers, params=params)
+
+        if resp.status_code != 200:
+            _negative_cache(cache_key, resp)
+            _raise_if_quota_exhausted(resp)
+            logger.error("YouTube API: Comments API error: %s", resp.text)
+            fetch_ok = False
+            break
+
+        data = orjson.loads(resp.content)
+        items = data.get("items", [])
+        if not items:
+            break
+
+        # One comprehension keeps the extract/strip/filter pass inside the
+        # C-level iterator instead of interpreted per-item appends. The
+        # fields mask guarantees the nested path, and the .get chain turns
+        # any malformed stragglers into empty strings the filter drops.
+        comments.extend(
+            text for text in (
+                item.get("snippet", {}).get("topLevelComment", {})
+                    .get("snippet", {}).get("textOriginal", "").strip()
+                for item in items
+            ) if text
+        )
+
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            break
+
     if not comments:
-        logger.warning(f"YouTube API: No valid comments extracted for video {video_id}")
-    
+        logger.warning("YouTube API: No valid comments extracted for video %s", video_id)
+
+    if fetch_ok:
+        _YT_CACHE.set(cache_key, comments, expire=_COMMENTS_CACHE_TTL)
+
     return comments
+
+async def fetch_comments_bulk(client: httpx.AsyncClient, video_ids, youtube_token=None, max_results=10, concurrency=8):
+    """Fetches top comments for many videos concurrently, bounded by a
+    semaphore so at most `concurrency` commentThreads calls are in flight.
+
+    Returns a dict of video_id -> list of comment texts; videos whose fetch
+    failed are simply absent. Quota exhaustion stops remaining fetches and
+    re-raises QuotaExceededError after the in-flight ones drain, keeping
+    the usual abort-the-batch contract.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+
+    async def one(video_id):
+        async with sem:
+            if stop.is_set():
+                raise QuotaExceededError("YouTube quota exhausted earlier in this batch")
+            try:
+                return await fetch_top_comments_async(client, video_id, max_results, youtube_token)
+            except QuotaExceededError:
+                stop.set()
+                raise
+
+    results = await asyncio.gather(*(one(v) for v in video_ids), return_exceptions=True)
+    comments_by_id = {}
+    quota_error = None
+    for video_id, result in zip(video_ids, results):
+        if isinstance(result, QuotaExceededError):
+            quota_error = result
+        elif isinstance(result, BaseException):
+            logger.error("YouTube API: Bulk comment fetch failed for video %s: %s", video_id, result)
+        else:
+            comments_by_id[video_id] = result
+    if quota_error is not None:
+        raise quota_error
+    return comments_by_id